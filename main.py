@@ -4,15 +4,33 @@
         Click the button "Open Folder" and select a folder containing Substance Painter materials.
         Then you may select what material and textures to import.
         When you're done click on Import button.
+    Run this file from Maya's script editor, or import it and call main() from a shelf button.
     Author: Thiago de Araujo Silva
     Date: 2022-12-07
 """
 
+from __future__ import annotations
+
+import re
 import json
 from enum import Enum
-from maya import cmds
-from os import path, listdir
-from functools import partial
+try: from maya import cmds, mel
+except ImportError: cmds = mel = None  # Allow importing this module outside of Maya
+from os import path, scandir
+from functools import partial, lru_cache
+
+
+@lru_cache(maxsize=1024)
+def _material_key(mat_name: str) -> str: return mat_name.capitalize()  # Memoized, each material name repeats once per texture file
+
+
+def _json_default(obj):
+    """ Serialize texture types by name and slotted records by their slots, for json.dumps """
+    if isinstance(obj, Enum):
+        return obj.name
+    if hasattr(obj, "__slots__"):
+        return {slot: getattr(obj, slot) for slot in obj.__slots__}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 
 class TexType(Enum):
@@ -24,19 +42,48 @@ class TexType(Enum):
     Height    = "height_not_implemented"
 
 
+class TexData:
+    """ Loaded texture file, its type resolved at load time (None if not supported), its import tag, and its modification time when scanned """
+    __slots__ = "path", "tex_type", "enabled", "mtime"
+
+    def __init__(self, path: str, tex_type: TexType | None, enabled: bool = True, mtime: float = 0.0) -> None:
+        self.path, self.tex_type, self.enabled, self.mtime = path, tex_type, enabled, mtime
+
+
+class MatData:
+    """ Loaded material textures by texture name, and its import tag """
+    __slots__ = "textures", "enabled"
+
+    def __init__(self, textures: dict[str, TexData] | None = None, enabled: bool = True) -> None:
+        self.textures, self.enabled = {} if textures is None else textures, enabled
+
+
 class MatImporter:
     # Define the file name prefix, suffix, and extensions static constants
     _PREFIX: str = "Mesh_"
     _SUFFIX: str = "_mat"
-    _EXTENSIONS: list[str] = ".png", ".bmp", ".jpeg", ".jpg"
+    _EXT_SET: frozenset[str] = frozenset({".png", ".bmp", ".jpeg", ".jpg"})
+
+    # Define the file name pattern capturing the material and texture names, built from the constants above, only the extension is case-insensitive
+    _FILENAME_RE: re.Pattern = re.compile(
+        rf"^{re.escape(_PREFIX)}(?P<mat>.+?){re.escape(_SUFFIX)}_(?P<tex>[^_]+)\.(?i:{'|'.join(ext[1:] for ext in sorted(_EXT_SET))})$")
 
     # Define the node connections blueprints' static constants
     _FILE_NODE_SIMPLE_BINDS: list[str] = "coverage", "wrapU", "mirrorU", "mirrorV", "vertexUvOne", "vertexCameraOne", "rotateFrame", "offset", \
                                          "repeatUV", "wrapV", "noiseUV", "stagger", "vertexUvTwo", "translateFrame", "vertexUvThree", "rotateUV"
     _FILE_NODE_UNIQUE_BINDS: list[tuple[str, str]] = ("outUV", "uv"), ("outUvFilterSize", "uvFilterSize")
+    _FILE_NODE_BINDS_MEL: str = "\n".join(
+        [f"connectAttr -f {{tex}}.{c} {{file}}.{c};" for c in _FILE_NODE_SIMPLE_BINDS] +
+        [f"connectAttr {{tex}}.{a} {{file}}.{b};" for a, b in _FILE_NODE_UNIQUE_BINDS])    # MEL template binding both nodes, formatted with their names
+
+    # Define the MEL template creating a material's shading engine and binding the material to it, formatted with the material name
+    _SHADING_ENGINE_MEL: str = 'connectAttr -f {material}.outColor (`sets -renderable true -noSurfaceShader true -empty -name "rsMaterial_{material}"` + ".surfaceShader");'
+
+    # Define the texture type lookup by file name suffix
+    _TEX_BY_NAME: dict[str, TexType] = {tex_type.name: tex_type for tex_type in TexType}
 
     def __init__(self) -> None:
-        self.loaded_mats = {}
+        self.loaded_mats: dict[str, MatData] = {}
         """ Structure containing all loaded materials """
         self.texture_type_filter = set(TexType)
         """ Filter containing all texture types that will be imported"""
@@ -44,18 +91,32 @@ class MatImporter:
         self.texture_type_filter.remove(TexType.Emissive)  # emissive and height textures aren't implemented in this tool
         self.texture_type_filter.remove(TexType.Height)
 
-    def __str__(self) -> str: return json.dumps(self.loaded_mats, sort_keys=True, indent=4)  # Convert the Loaded data into a json string
+    def __str__(self) -> str: return json.dumps(self.loaded_mats, indent=4, default=_json_default)  # Convert the Loaded data into a json string
 
-    def delete_materials_data(self) -> None: self.loaded_mats = {}  # Delete data saved on _loaded_mats
+    def delete_materials_data(self) -> None:
+        """ Delete data saved on loaded_mats """
+        self.loaded_mats = {}
+        _material_key.cache_clear()
 
     def load_materials_data(self, folder_path) -> None:
         """ Load all file names contained in the selected folder, then populate loaded_mats structure with the data found """
-        for file in listdir(folder_path):                                                                                                      # For each file in folder
-            if file.endswith(MatImporter._EXTENSIONS):                                                                                         # If it has the extensions
-                mat_name, tex_name = path.splitext(file)[0].removeprefix(MatImporter._PREFIX).replace(MatImporter._SUFFIX, "").rsplit("_", 1)  # Find the material and texture names from file name
-                self.loaded_mats.setdefault(
-                    mat_name.capitalize(), [{}, True])[0].setdefault(
-                        tex_name, [path.normcase(path.join(folder_path, file)), True])   # Structure files in this schema "mat_dict{mat_name: ({tex_name:(path, tex_import_bool)}, mat_import_bool)}"
+        with scandir(folder_path) as entries:                                                                                                      # For each entry in folder
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):                                                                                       # Skip directories and links
+                    continue
+                match = MatImporter._FILENAME_RE.match(entry.name)                                                                                 # Skip if it doesn't follow the file name schema
+                if not match:
+                    continue
+                stat = entry.stat(follow_symlinks=False)                                                                                           # Skip empty files, they can't be loaded as textures
+                if stat.st_size == 0:
+                    continue
+                mat_name, tex_name = match.group("mat", "tex")                                                                                     # Find the material and texture names from file name
+                mat_key = _material_key(mat_name)
+                mat_data = self.loaded_mats.get(mat_key)                                                                                           # Structure files in this schema "mat_dict{mat_name: MatData(textures={tex_name: TexData})}"
+                if mat_data is None:
+                    mat_data = self.loaded_mats[mat_key] = MatData()
+                if tex_name not in mat_data.textures:                                                                                              # Keep the first file found for each texture
+                    mat_data.textures[tex_name] = TexData(path.normcase(entry.path), MatImporter._TEX_BY_NAME.get(tex_name), mtime=stat.st_mtime)
 
     @staticmethod
     def _create_texture_node(name: str, file_name: str, isRaw: bool = False) -> tuple[str, str]:
@@ -63,48 +124,75 @@ class MatImporter:
         node_file = cmds.shadingNode("file", name=f"{name}_file", asTexture=True, isColorManaged=True)    # Create file node
         node_tex = cmds.shadingNode("place2dTexture", name=f"{name}_texture", asUtility=True)             # Create texture node
 
-        for connection in MatImporter._FILE_NODE_SIMPLE_BINDS:                                            # Foreach symmetric connection
-            cmds.connectAttr(f"{node_tex}.{connection}", f"{node_file}.{connection}", force=True)           # Connect both nodes
-        for connection_a, connection_b in MatImporter._FILE_NODE_UNIQUE_BINDS:                            # Foreach non-symmetric connection
-            cmds.connectAttr(f"{node_tex}.{connection_a}", f"{node_file}.{connection_b}")                   # Connect both nodes
+        mel.eval(MatImporter._FILE_NODE_BINDS_MEL.format(tex=node_tex, file=node_file))                  # Connect both nodes in a single command engine call
 
-        cmds.setAttr(f"{node_file}.fileTextureName", file_name, type="string")                            # Set texture file name
-        if isRaw: cmds.setAttr(f"{node_file}.colorSpace", "Raw", type="string")                           # If texture is raw, set its type as raw
+        file_prefix = node_file + "."                                                                     # Build the attribute prefix once
+        cmds.setAttr(file_prefix + "fileTextureName", file_name, type="string")                           # Set texture file name
+        if isRaw: cmds.setAttr(file_prefix + "colorSpace", "Raw", type="string")                          # If texture is raw, set its type as raw
         return node_file, node_tex                                                                        # Return nodes names
 
-    def import_loaded_material(self, material_name: str) -> None:
-        """ Create Material and bind all its textures to it """
-        material_node = cmds.shadingNode("RedshiftMaterial", asShader=True, name=material_name)           # Create the shader node
-        cmds.sets(renderable=True, noSurfaceShader=True, empty=True, name=f"rsMaterial_{material_node}")  # Bind the shader engine node to it
-        cmds.connectAttr(f"{material_node}.outColor", f"rsMaterial_{material_node}.surfaceShader")
-
-        for tex_name, (file, is_import) in self.loaded_mats[material_name][0].items():                    # For each file in material texture dictionary
-            if not is_import:                                                                             # Skip if this texture was tagged as no import
+    def _textures_to_import(self, material_name: str, active_types: frozenset[TexType]) -> list[tuple[TexType, str]]:
+        """ List the (type, path) of the material's textures tagged for import whose type is in active_types """
+        to_import = []
+        for tex_name, tex_data in self.loaded_mats[material_name].textures.items():                       # For each file in material texture dictionary
+            if not tex_data.enabled:                                                                      # Skip if this texture was tagged as no import
                 continue
 
-            try: tex_type: TexType = TexType[tex_name]
-            except KeyError:                                                                              # Skip this texture if its type is not acknowledged by the tool
-                print(f"{tex_name} texture type is not supported\n{material_node}_{tex_name} was not imported\nFile: {file}\n")
+            if tex_data.tex_type is None:                                                                 # Skip this texture if its type is not acknowledged by the tool
+                print(f"{tex_name} texture type is not supported\n{material_name}_{tex_name} was not imported\nFile: {tex_data.path}\n")
                 continue
 
-            if tex_type not in self.texture_type_filter:                                                  # Skip if this texture, if it's type was tagged as no import
-                continue
+            if tex_data.tex_type in active_types:                                                         # Keep this texture if its type is tagged for import
+                to_import.append((tex_data.tex_type, tex_data.path))
+        return to_import
+
+    def import_loaded_material(self, material_name: str, textures: list[tuple[TexType, str]] | None = None) -> None:
+        """ Create Material and bind all its textures to it, textures defaults to the ones selected by the current filter """
+        if textures is None:
+            textures = self._textures_to_import(material_name, frozenset(self.texture_type_filter))
 
+        cmds.undoInfo(openChunk=True)                                                                     # Group the whole material into a single undo step
+        try: self._import_loaded_material(material_name, textures)
+        finally: cmds.undoInfo(closeChunk=True)
+
+    def _import_loaded_material(self, material_name: str, textures: list[tuple[TexType, str]]) -> None:
+        """ Build the material's node network, called inside import_loaded_material's undo chunk """
+        material_node = cmds.shadingNode("RedshiftMaterial", asShader=True, name=material_name)           # Create the shader node
+        mel.eval(MatImporter._SHADING_ENGINE_MEL.format(material=material_node))                          # Bind the shader engine node to it
+
+        for tex_type, file in textures:                                                                   # For each filtered texture of this material
             node_file, node_tex = MatImporter._create_texture_node(f"{material_name}_{tex_type.name}", file_name=file, isRaw=tex_type != TexType.BaseColor)  # Create a texture node
             cmds.defaultNavigation(connectToExisting=True, source=node_file, destination=f"{material_node}.{tex_type.value}")  # Connect this node to the material node
 
             if tex_type == TexType.Normal:                               # If it's a Normal texture
-                bump_node = cmds.ls(sl=True)[0]                          # Select the extra bump map node
+                bump_node = cmds.listConnections(f"{material_node}.{tex_type.value}", source=True, destination=False, type="RedshiftBumpMap")[0]  # Find the extra bump map node
                 cmds.setAttr(f"{bump_node}.inputType", 1)                # Set its input type node
 
             elif tex_type == TexType.Metallic:                           # If it's a Metallic node
                 cmds.setAttr(f"{material_node}.refl_fresnel_mode", 2)    # Set the main mat node fresnel mode to 2
 
     def import_all_loaded_materials(self) -> None:
-        for material_name, (_, is_import) in self.loaded_mats.items():  # For each loaded material
-            if not is_import:
-                continue
-            self.import_loaded_material(material_name)                   # Import that material
+        """ Import every material tagged for import, with viewport refresh and DG evaluation suspended """
+        active_types = frozenset(self.texture_type_filter)                  # Snapshot the filter once for the whole import
+        previous_mode = cmds.evaluationManager(query=True, mode=True)[0]    # Save the current evaluation mode
+
+        cmds.refresh(suspend=True)                                          # Stop redrawing the viewport after each node creation
+        try:
+            cmds.evaluationManager(mode="off")
+            try:
+                cmds.undoInfo(openChunk=True)                               # Group the whole import into a single undo step
+                try:
+                    for material_name, mat_data in self.loaded_mats.items():    # For each loaded material
+                        if not mat_data.enabled:
+                            continue
+                        self.import_loaded_material(material_name, self._textures_to_import(material_name, active_types))  # Import that material
+                finally:
+                    cmds.undoInfo(closeChunk=True)
+            finally:
+                cmds.evaluationManager(mode=previous_mode)                  # Restore the evaluation mode
+        finally:
+            cmds.refresh(suspend=False)                                     # Resume the viewport and redraw once
+            cmds.refresh(force=True)
 
 
 class ControlWindow:
@@ -112,12 +200,16 @@ class ControlWindow:
 
     _NAME: str = "Redshift_Material_Importer"
     _DARK_BGC, _GREEN_BGC, _RED_BGC = (0.2, 0.2, 0.2), (0.2, 0.7, 0.2), (0.215, 0.19, 0.21)
+    _TEX_BUTTON_WIDTHS: tuple[int, ...] = 74, 72, 66, 84, 70, 68  # Texture type button widths, in TexType order
     _singleton_instance = None
 
     def __init__(self, inspected_tool):
         self._materials_shelf_layout = ""
         """ Material shelf's element path """
 
+        self._material_row_widgets: dict[str, tuple[str, str, str]] = {}
+        """ Material shelf's (row, toggle, button) element paths by material name """
+
         self._texture_shelf_layout = ""
         """ Texture shelf's element path """
 
@@ -130,6 +222,9 @@ class ControlWindow:
         self.tool = inspected_tool
         """ Inspected tool's reference"""
 
+        self._toggle_partials = {tex_type: partial(self._toggle_filter, tex_type) for tex_type in TexType}
+        """ Texture type button callbacks, reused whenever the window is assembled """
+
         self.tool.delete_materials_data()  # refresh importer's data
 
     def open_window(self) -> None:
@@ -141,10 +236,12 @@ class ControlWindow:
     def _open_folder(self, *_) -> None:
         """ Search for a folder path then request the tool to inspect its content """
         folder = cmds.fileDialog2(dialogStyle=2, fm=3)
-        if folder:
-            self._inspected_folder = folder[0]
-            self.tool.load_materials_data(self._inspected_folder)
+        if not folder:                                          # Keep the current shelf if the dialog was cancelled
+            return
 
+        self._inspected_folder = folder[0]
+        self.tool.delete_materials_data()                       # Forget the previous folder's materials before loading the new one
+        self.tool.load_materials_data(self._inspected_folder)
         self._draw_materials_shelf_layout()
 
     def _import_selected(self, *_) -> None:
@@ -173,17 +270,16 @@ class ControlWindow:
 
         return window_element
 
+    def _toggle_filter(self, category, value) -> None:
+        """ Toggle texture filter's elements """
+        if value: self.tool.texture_type_filter.add(category)
+        else: self.tool.texture_type_filter.discard(category)
+
     def _draw_texture_import_options_box(self) -> str:
         """ Draw the texture type import options box then bind it to the tool """
-        def toggle(category, value):            # Toggle texture filter's elements
-            if value: self.tool.texture_type_filter.add(category)
-            else: self.tool.texture_type_filter.remove(category)
-
-        width_list = [74, 72, 66, 84, 70, 68]   # List of texture type button widths
-
         cmds.separator(h=6)
         root = cmds.rowLayout(nc=6, columnAttach=[(1, 'left', 0)])
-        button_elements = {v: cmds.iconTextCheckBox(st='textOnly', w=w, h=30, l=v.name, bgc=ControlWindow._DARK_BGC, cc=partial(toggle, v), v=True) for w, v in zip(width_list, list(TexType))}
+        button_elements = {v: cmds.iconTextCheckBox(st='textOnly', w=w, h=30, l=v.name, bgc=ControlWindow._DARK_BGC, cc=self._toggle_partials[v], v=v in self.tool.texture_type_filter) for w, v in zip(ControlWindow._TEX_BUTTON_WIDTHS, TexType)}
 
         cmds.iconTextCheckBox(button_elements[TexType.Emissive], e=True, enable=False)  # Disable the non implemented texture types
         cmds.iconTextCheckBox(button_elements[TexType.Height],   e=True, enable=False)
@@ -194,57 +290,76 @@ class ControlWindow:
 
     def _draw_materials_shelf_layout(self) -> str:
         """ Draw the material shelf containing all the materials found inside the inspected folder """
-        def on_material_toggle_switched(data_reference, state): data_reference[1] = state   # Toggle the material import tag on toggle element pressed
+        def on_material_toggle_switched(data_reference, state): data_reference.enabled = state   # Toggle the material import tag on toggle element pressed
         def on_material_button_pressed(data_reference, selected_button_element, *_):        # Load a new texture set panel for the selected material
-            for button_element in button_elements:
+            for _, _, button_element in self._material_row_widgets.values():
                 cmds.iconTextCheckBox(button_element, e=True, value=button_element == selected_button_element)
-            self._draw_texture_shelf_layout(data_reference[0])
-
-        button_elements = []    # list with loaded material button elements
-
-        self._destroy_materials_shelf_layout()  # Reset the material shelf layout before building a new one
-
-        cmds.setParent(self._main_column_split_layout)
-        self._materials_shelf_layout = cmds.scrollLayout(hst=0, vst=8, vsb=True, h=500, w=248, childResizable=True)
-
-        for name, data in self.tool.loaded_mats.items():    # For each material create a [Toggle|Button] element then bind this structure to the tool
-            cmds.rowLayout(numberOfColumns=2, columnAttach=[(1, 'left', 1), (2, 'left', 1)])
-            cmds.iconTextCheckBox(st='textOnly', w=30, h=30, label=" ", hlc=ControlWindow._GREEN_BGC, bgc=ControlWindow._RED_BGC, cc=partial(on_material_toggle_switched, data), value=data[1])
-            button = cmds.iconTextCheckBox(st='textOnly', w=195, h=30, label=name, bgc=ControlWindow._DARK_BGC)
-            cmds.iconTextCheckBox(button, e=True, cc=partial(on_material_button_pressed, data, button))
-            button_elements.append(button)
-            cmds.setParent(self._materials_shelf_layout)
-
+            self._draw_texture_shelf_layout(data_reference.textures)
+
+        self._destroy_textures_shelf_layout()   # The texture shelf belongs to the previous selection
+
+        kept_names = [name for name in self._material_row_widgets if name in self.tool.loaded_mats]              # Rows that can be reused, in shelf order
+        if kept_names != list(self.tool.loaded_mats)[:len(kept_names)]:                                          # Maya can't reorder layout children, so rebuild if new rows wouldn't land in scan order
+            self._destroy_materials_shelf_layout()
+
+        if not self._materials_shelf_layout or not cmds.scrollLayout(self._materials_shelf_layout, exists=True):  # Build the material shelf layout only if it doesn't exist yet
+            cmds.setParent(self._main_column_split_layout)
+            self._materials_shelf_layout = cmds.scrollLayout(hst=0, vst=8, vsb=True, h=500, w=248, childResizable=True)
+            self._material_row_widgets = {}
+
+        for name in self._material_row_widgets.keys() - self.tool.loaded_mats.keys():   # Delete only the rows of materials that are no longer loaded
+            cmds.deleteUI(self._material_row_widgets.pop(name)[0])
+
+        for name, data in self.tool.loaded_mats.items():    # For each material reuse or create a [Toggle|Button] element then bind this structure to the tool
+            widgets = self._material_row_widgets.get(name)
+            if widgets is None:
+                cmds.setParent(self._materials_shelf_layout)
+                row = cmds.rowLayout(numberOfColumns=2, columnAttach=[(1, 'left', 1), (2, 'left', 1)])
+                toggle = cmds.iconTextCheckBox(st='textOnly', w=30, h=30, label=" ", hlc=ControlWindow._GREEN_BGC, bgc=ControlWindow._RED_BGC)
+                button = cmds.iconTextCheckBox(st='textOnly', w=195, h=30, label=name, bgc=ControlWindow._DARK_BGC)
+                widgets = self._material_row_widgets[name] = row, toggle, button
+            _, toggle, button = widgets
+            cmds.iconTextCheckBox(toggle, e=True, cc=partial(on_material_toggle_switched, data), value=data.enabled)
+            cmds.iconTextCheckBox(button, e=True, cc=partial(on_material_button_pressed, data, button), value=False)
+
+        cmds.setParent(self._materials_shelf_layout)
         return self._materials_shelf_layout  # return root
 
     def _draw_texture_shelf_layout(self, data) -> str:
-        def on_texture_selected(data_reference, state): data_reference[1] = state  # Toggle the texture import tag on toggle element pressed
+        def on_texture_selected(data_reference, state): data_reference.enabled = state  # Toggle the texture import tag on toggle element pressed
 
         self._destroy_textures_shelf_layout()
 
         cmds.setParent(self._main_column_split_layout)
         self._texture_shelf_layout = cmds.scrollLayout(hst=0, vst=8, vsb=True, h=500, w=200, childResizable=True)
         for name, data in data.items():
-            cmds.iconTextCheckBox(st='iconAndTextVertical', i1=data[0], l=name, w=80, h=82, cc=partial(on_texture_selected, data), value=data[1])
+            cmds.iconTextCheckBox(st='iconAndTextVertical', i1=data.path, l=name, w=80, h=82, cc=partial(on_texture_selected, data), value=data.enabled)
             cmds.separator(h=2)
 
         return self._texture_shelf_layout
 
     def _destroy_materials_shelf_layout(self):
         """ Destroy the material and texture shelf layout element and its children """
-        if self._materials_shelf_layout:
-            self._destroy_textures_shelf_layout()
+        self._destroy_textures_shelf_layout()
+        if self._materials_shelf_layout and cmds.scrollLayout(self._materials_shelf_layout, exists=True):
             cmds.deleteUI(self._materials_shelf_layout)
-            self._materials_shelf_layout = ""
+        self._materials_shelf_layout = ""
+        self._material_row_widgets = {}
 
     def _destroy_textures_shelf_layout(self):
         """ Destroy the texture shelf layout element and its children """
-        if self._texture_shelf_layout:
+        if self._texture_shelf_layout and cmds.scrollLayout(self._texture_shelf_layout, exists=True):
             cmds.deleteUI(self._texture_shelf_layout)
-            self._texture_shelf_layout = ""
+        self._texture_shelf_layout = ""
+
+
+def main() -> None:
+    """ Open the importer window """
+    tool = MatImporter()
+    window = ControlWindow(tool)
+    window.open_window()
 
 
-tool = MatImporter()
-window = ControlWindow(tool)
-window.open_window()
+if __name__ == "__main__":
+    main()
 